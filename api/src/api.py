@@ -26,7 +26,6 @@ app.add_middleware(
 async def get_hello_world(request: Request) -> str:
     logger.info("\n" + "=" * 80)
     logger.info("/hello_world endpoint called")
-    logger.info(f"Request headers: {dict(request.headers)}")
     
     # Frontend sends:
     # - Authorization: Bearer <access_token> (for API authorization, not used here)
@@ -35,7 +34,6 @@ async def get_hello_world(request: Request) -> str:
     
     if not id_token:
         logger.error("No ID token provided in X-IdToken header")
-        logger.error(f"Available headers: {list(request.headers.keys())}")
         raise HTTPException(status_code=401, detail="No ID token provided. Expected X-IdToken header.")
     
     logger.info(f"ID token received (length: {len(id_token)})")
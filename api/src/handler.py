@@ -1,14 +1,21 @@
-import asyncio
-import json
 import os
 from typing import Dict, Any
-from api_gateway_handler import is_api_gateway_event, handle_api_gateway_event
+import orjson
+from api_gateway_handler import loop, handle_api_gateway_event
 from infrastructure import initialize
 
 
+# Error bodies have a fixed shape, so only their dynamic fields get serialized per call
+_UNKNOWN_EVENT_BODY_TMPL = '{{"error":"Unknown event type - only API Gateway events are supported","event_keys":{keys}}}'
+_INTERNAL_ERROR_BODY_TMPL = '{{"error":"Internal server error","message":{message}}}'
+
+# Dumping the whole event is costly for large API Gateway payloads, so it's opt-in
+_DEBUG_EVENT_LOG = os.getenv("DEBUG_EVENT_LOG") == "1"
+
+
 if "AWS_EXECUTION_ENV" in os.environ:
-    loop = asyncio.get_event_loop()
-    # Initialize infrastructure components
+    # Initialize infrastructure components on the same loop Mangum serves requests from,
+    # so anything initialize() binds to it stays usable across warm invocations
     loop.run_until_complete(initialize())
 
 
@@ -29,30 +36,29 @@ def lambda_handler(event: Dict[str, Any], context) -> Dict[str, Any]:
     """
     try:
         # Log the incoming event for debugging
-        print(f"Received event: {json.dumps(event, default=str)}")
+        if _DEBUG_EVENT_LOG:
+            print(f"Received event: {orjson.dumps(event, default=str).decode()}")
         
-        # Check if this is an API Gateway event (v1 or v2)
-        if is_api_gateway_event(event):
-            print("Processing API Gateway event")
+        # Check if this is an API Gateway event: v1 (REST API) has 'httpMethod',
+        # v2 (HTTP API) has 'routeKey' and/or 'requestContext.http'
+        if (
+            'httpMethod' in event
+            or 'routeKey' in event
+            or ('requestContext' in event and 'http' in event['requestContext'])
+        ):
             return handle_api_gateway_event(event, context)
         
         # If it's not an API Gateway event, log and return error
         print(f"Unknown event type: {event.keys()}")
         return {
             'statusCode': 400,
-            'body': json.dumps({
-                'error': 'Unknown event type - only API Gateway events are supported',
-                'event_keys': list(event.keys())
-            })
+            'body': _UNKNOWN_EVENT_BODY_TMPL.format(keys=orjson.dumps(list(event.keys())).decode())
         }
         
     except Exception as e:
         print(f"Error processing event: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
+            'body': _INTERNAL_ERROR_BODY_TMPL.format(message=orjson.dumps(str(e)).decode())
         }
 
@@ -1,5 +1,6 @@
 import os
 import logging
+import orjson
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from infrastructure.id_token import IdTokenWithJose
@@ -24,11 +25,10 @@ app.add_middleware(
 @app.post("/webhook")
 async def webhook(request: Request):
     """Webhook example endpoint for processing various events"""
-    import json
     body = await request.body()
     try:
-        data = json.loads(body) if body else {}
-    except json.JSONDecodeError:
+        data = orjson.loads(body) if body else {}
+    except orjson.JSONDecodeError:
         data = {"raw_body": body.decode('utf-8')}
     
     return {
@@ -41,7 +41,6 @@ async def webhook(request: Request):
 async def get_hello_world(request: Request) -> str:
     logger.info("\n" + "=" * 80)
     logger.info("/hello_world endpoint called")
-    logger.info(f"Request headers: {dict(request.headers)}")
     
     # Frontend sends:
     # - Authorization: Bearer <access_token> (for API authorization, not used here)
@@ -50,7 +49,6 @@ async def get_hello_world(request: Request) -> str:
     
     if not id_token:
         logger.error("No ID token provided in X-IdToken header")
-        logger.error(f"Available headers: {list(request.headers.keys())}")
         raise HTTPException(status_code=401, detail="No ID token provided. Expected X-IdToken header.")
     
     logger.info(f"ID token received (length: {len(id_token)})")
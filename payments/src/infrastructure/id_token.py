@@ -1,11 +1,26 @@
 from typing import Any
+import asyncio
+import hashlib
 import logging
-import requests
-from jose import jwt
+import threading
+import time
+import jwt
+import orjson
+import urllib3
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+from jwt.algorithms import RSAAlgorithm
 from .user import User
 
 logger = logging.getLogger(__name__)
 
+# Created at import time so the pooled TCP+TLS connection to Cognito survives across warm invocations
+_http = urllib3.PoolManager(
+    maxsize=4,
+    headers={"Accept": "application/json"},
+    timeout=urllib3.Timeout(connect=2.0, read=5.0),
+    retries=urllib3.Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504]),
+)
+
 
 class IdTokenWithJose:
     _aws_region: str | None = None
@@ -13,6 +28,25 @@ class IdTokenWithJose:
     _cognito_region: str | None = None
     _cognito_user_pool_id: str | None = None
     _cognito_client_ids: list[str] = []
+    _cognito_client_id_set: frozenset[str] = frozenset()
+    _expected_issuer: str = ""
+    _jwks_url: str = ""
+
+    # Public keys indexed by kid, cached per (cognito_region, cognito_user_pool_id) with the fetch time
+    _jwks_ttl: float = 3600.0
+    _jwks_cache: dict[tuple[str | None, str | None], tuple[float, dict[str, RSAPublicKey]]] = {}
+    # Unknown kids force a refetch, but at most once per interval so bogus tokens can't hammer Cognito
+    _jwks_min_refresh_interval: float = 60.0
+    _jwks_lock = threading.Lock()
+    # Started by initialize(), refetches the JWKS every half TTL so requests never wait on a refetch
+    _jwks_refresh_task: asyncio.Task[None] | None = None
+
+    # Verified claims keyed by a BLAKE2b-128 digest of the token (never the token itself), with the
+    # time they stop being served: the token's exp minus _claims_cache_skew seconds
+    _claims_cache_maxsize: int = 1024
+    _claims_cache_skew: float = 30.0
+    _claims_cache: dict[bytes, tuple[float, dict[str, Any]]] = {}
+    _claims_cache_lock = threading.Lock()
 
     @classmethod
     def set_environment(
@@ -25,11 +59,11 @@ class IdTokenWithJose:
     ) -> None:
         logger.info("\n" + "=" * 80)
         logger.info("Setting environment:")
-        logger.info(f"  aws_region: {aws_region}")
-        logger.info(f"  deployment_id: {deployment_id}")
-        logger.info(f"  cognito_region: {cognito_region}")
-        logger.info(f"  cognito_user_pool_id: {cognito_user_pool_id}")
-        logger.info(f"  cognito_client_ids: {cognito_client_ids}")
+        logger.info("  aws_region: %s", aws_region)
+        logger.info("  deployment_id: %s", deployment_id)
+        logger.info("  cognito_region: %s", cognito_region)
+        logger.info("  cognito_user_pool_id: %s", cognito_user_pool_id)
+        logger.info("  cognito_client_ids: %s", cognito_client_ids)
         logger.info("=" * 80 + "\n")
         
         # Set values with warnings instead of exceptions to allow server to boot
@@ -62,14 +96,98 @@ class IdTokenWithJose:
             cls._cognito_client_ids = []
         else:
             cls._cognito_client_ids = cognito_client_ids
-            logger.info(f"✅ Environment set successfully with {len(cognito_client_ids)} client ID(s)\n")
+            logger.info("✅ Environment set successfully with %s client ID(s)\n", len(cognito_client_ids))
+        cls._cognito_client_id_set = frozenset(cls._cognito_client_ids)
+
+        cls._expected_issuer = f"https://cognito-idp.{cls._cognito_region}.amazonaws.com/{cls._cognito_user_pool_id}"
+        cls._jwks_url = cls._expected_issuer + "/.well-known/jwks.json"
+
+    @classmethod
+    def get_cognito_jwks(cls, force_refresh: bool = False) -> dict[str, RSAPublicKey]:
+        """
+        Returns the Cognito public keys indexed by kid.
+
+        The keys are cached for _jwks_ttl seconds, so warm invocations don't pay the HTTPS round-trip.
+        force_refresh refetches them (e.g. after a key rotation) unless they are younger than
+        _jwks_min_refresh_interval seconds. If a refetch fails, the cached keys keep being served.
+        """
+        cache_key = (cls._cognito_region, cls._cognito_user_pool_id)
+        cached = cls._jwks_cache.get(cache_key)
+        if cached is not None:
+            age = time.monotonic() - cached[0]
+            if age < (cls._jwks_min_refresh_interval if force_refresh else cls._jwks_ttl):
+                return cached[1]
+
+        with cls._jwks_lock:
+            # Another caller may have refetched the keys while we were waiting for the lock
+            current = cls._jwks_cache.get(cache_key)
+            if current is not None and current is not cached:
+                return current[1]
+            return cls._refetch_jwks()
+
+    @classmethod
+    def _refresh_jwks(cls) -> dict[str, RSAPublicKey]:
+        """
+        Refetches the JWKS under _jwks_lock, so it never races a refetch on the request path.
+        """
+        with cls._jwks_lock:
+            return cls._refetch_jwks()
+
+    @classmethod
+    def _refetch_jwks(cls) -> dict[str, RSAPublicKey]:
+        """
+        Refetches the JWKS, falling back to the cached keys if Cognito can't be reached. The fallback
+        is stamped as fresh, so requests don't each block on a retried fetch until the next refresh.
+        Only raises if there are no cached keys. The caller must hold _jwks_lock.
+        """
+        cache_key = (cls._cognito_region, cls._cognito_user_pool_id)
+        try:
+            return cls._prime_jwks()
+        except Exception as e:
+            cached = cls._jwks_cache.get(cache_key)
+            if cached is None:
+                raise
+            logger.warning("JWKS refetch failed, keeping the cached keys: %s", e)
+            cls._jwks_cache[cache_key] = (time.monotonic(), cached[1])
+            return cached[1]
+
+    @classmethod
+    def _prime_jwks(cls) -> dict[str, RSAPublicKey]:
+        """
+        Fetches the JWKS from Cognito and builds the public key object for every kid up front,
+        so verification doesn't have to reconstruct the RSA key on each call.
+        """
+        response = _http.request("GET", cls._jwks_url)
+        if response.status != 200:
+            raise Exception(f"JWKS request to {cls._jwks_url} failed with HTTP {response.status}")
+        # Only RSA signing keys can verify RS256 tokens; anything else would make from_jwk raise
+        keys_by_kid: dict[str, RSAPublicKey] = {
+            k["kid"]: RSAAlgorithm.from_jwk(k)  # type: ignore
+            for k in orjson.loads(response.data)["keys"]
+            if k.get("kty") == "RSA" and k.get("use", "sig") == "sig"
+        }
+        cls._jwks_cache[(cls._cognito_region, cls._cognito_user_pool_id)] = (time.monotonic(), keys_by_kid)
+        return keys_by_kid
+
+    @classmethod
+    async def initialize(cls) -> None:
+        """
+        Fetches the JWKS during INIT, so the first request finds the keys cached, and starts the
+        background refresh on the running loop. Raises if the initial fetch fails.
+        """
+        if cls._jwks_refresh_task is None:
+            cls._jwks_refresh_task = asyncio.create_task(cls._refresh_jwks_periodically())
+        await asyncio.to_thread(cls._refresh_jwks)
 
     @classmethod
-    def get_cognito_jwks(cls):
-        url = f"https://cognito-idp.{cls._cognito_region}.amazonaws.com/{cls._cognito_user_pool_id}/.well-known/jwks.json"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()["keys"]
+    async def _refresh_jwks_periodically(cls) -> None:
+        # Only makes progress while the loop runs, i.e. during invocations, which is when it matters
+        while True:
+            await asyncio.sleep(cls._jwks_ttl / 2)
+            try:
+                await asyncio.to_thread(cls._refresh_jwks)
+            except Exception as e:
+                logger.warning("Background JWKS refresh failed: %s", e)
 
     @classmethod
     def verify_id_token(cls, id_token: str) -> dict[str, Any]:
@@ -87,102 +205,101 @@ class IdTokenWithJose:
         if not cls._cognito_client_ids or len(cls._cognito_client_ids) == 0:
             raise ValueError("No Cognito client IDs configured. Check RUNTIME_JSON and SSM parameters. See server logs for details.")
         
-        # Decode token header to get kid
+        # Decode the token header (for the kid) and claims (for the audience) in a single unverified pass
         try:
-            header = jwt.get_unverified_header(id_token)
-            logger.info(f"Token header: {header}")
-            kid = header.get("kid")
-            if not kid:
-                logger.error("No 'kid' found in token header")
-                raise ValueError("Invalid token: No key ID found in token header.")
-            logger.info(f"Token key ID (kid): {kid}")
+            unverified = jwt.decode_complete(id_token, options={"verify_signature": False})
         except Exception as e:
-            logger.error(f"Error decoding token header: {e}", exc_info=True)
-            raise ValueError(f"Invalid token: Cannot decode header. {str(e)}") from e
+            logger.debug("Error decoding token: %s", e)
+            raise ValueError(f"Invalid token: Cannot decode header or claims. {str(e)}") from e
+        header = unverified["header"]
+        unverified_claims = unverified["payload"]
+
+        logger.info("Token header: %s", header)
+        kid = header.get("kid")
+        if not kid:
+            logger.error("No 'kid' found in token header")
+            raise ValueError("Invalid token: No key ID found in token header.")
+        logger.info("Token key ID (kid): %s", kid)
+
+        # Reject access and other non-ID tokens before paying for the RSA verification
+        token_use = unverified_claims.get("token_use")
+        logger.info("Token use: %s", token_use)
+        if token_use != "id":
+            logger.error("token_use is '%s', expected 'id'", token_use)
+            raise ValueError(f"Invalid token: token_use is '{token_use}', expected 'id'.")
 
-        # Get JWKS from Cognito
+        # Match the token audience against the configured client IDs before paying for the RSA verification
+        token_aud = unverified_claims.get("aud")
+        if not isinstance(token_aud, str) or token_aud not in cls._cognito_client_id_set:
+            logger.error("Token audience: %s", token_aud)
+            logger.error("Expected audiences: %s", cls._cognito_client_ids)
+            raise ValueError(f"Token audience mismatch. Token audience does not match any of: {cls._cognito_client_ids}")
+
+        # Get JWKS from Cognito (cached) and find the key matching the kid in the token header
         try:
-            logger.info("Fetching JWKS from Cognito...")
             keys = cls.get_cognito_jwks()
-            logger.info(f"Retrieved {len(keys)} keys from JWKS")
+            key = keys.get(kid)
+            if key is None:
+                # Unknown kid, Cognito may have rotated its keys: refetch once
+                logger.info("kid %s not in cached JWKS, refetching from Cognito...", kid)
+                keys = cls.get_cognito_jwks(force_refresh=True)
+                key = keys.get(kid)
+            logger.info("Retrieved %s keys from JWKS", len(keys))
         except Exception as e:
-            logger.error(f"Error fetching JWKS: {e}", exc_info=True)
+            logger.error("Error fetching JWKS: %s", e, exc_info=True)
             raise ValueError(f"Cannot fetch JWKS from Cognito: {str(e)}") from e
 
-        # Find the key matching the kid in the token header
-        key = next((k for k in keys if k["kid"] == kid), None)
         if key is None:
-            available_kids = [k.get("kid") for k in keys]
-            logger.error(f"No key found in jwks.json for kid: {kid}")
-            logger.error(f"Available kids in JWKS: {available_kids}")
+            available_kids = list(keys.keys())
+            logger.error("No key found in jwks.json for kid: %s", kid)
+            logger.error("Available kids in JWKS: %s", available_kids)
             raise ValueError(f"Public key not found in jwks.json for kid: {kid}")
 
-        # Verify token - try all client IDs
-        expected_issuer = f"https://cognito-idp.{cls._cognito_region}.amazonaws.com/{cls._cognito_user_pool_id}"
+        # Verify token against the client ID it was issued for
+        expected_issuer = cls._expected_issuer
         logger.info("Verifying token with:")
-        logger.info(f"  possible audiences (client_ids): {cls._cognito_client_ids}")
-        logger.info(f"  issuer: {expected_issuer}")
-        
-        # Try each client ID until one works
-        last_error: Exception | None = None
-        for client_id in cls._cognito_client_ids:
-            try:
-                logger.info(f"Trying to verify with client_id: {client_id}")
-                # This verifies the signature as well as checks expiration etc.
-                claims = jwt.decode(
-                    id_token,
-                    key,
-                    algorithms=["RS256"],
-                    audience=client_id,
-                    issuer=expected_issuer,
-                    options={"verify_at_hash": False},  # Skip at_hash verification
-                )
-                logger.info(f"Token verified successfully with client_id: {client_id}")
-                logger.info(f"Token claims: token_use={claims.get('token_use')}, sub={claims.get('sub')}, aud={claims.get('aud')}")
-                return claims
-            except jwt.ExpiredSignatureError as e:
-                logger.error(f"Token expired: {e}")
-                raise ValueError("Token has expired.") from e
-            except jwt.InvalidAudienceError as e:
-                logger.debug(f"Token audience mismatch for client_id {client_id}, trying next...")
-                last_error = e
-                continue  # Try next client ID
-            except jwt.InvalidIssuerError as e:
-                logger.error(f"Invalid issuer: {e}")
-                logger.error(f"Expected issuer: {expected_issuer}")
-                raise ValueError(f"Token issuer mismatch. Expected: {expected_issuer}") from e
-            except Exception as e:
-                logger.error(f"Token verification error with client_id {client_id}: {type(e).__name__}: {e}", exc_info=True)
-                last_error = e
-                continue  # Try next client ID
+        logger.info("  audience (client_id): %s", token_aud)
+        logger.info("  issuer: %s", expected_issuer)
         
-        # If we get here, none of the client IDs worked
-        logger.error(f"Token verification failed for all {len(cls._cognito_client_ids)} client ID(s)")
-        # Try to get token audience for debugging (decode without verification)
         try:
-            # Decode without verification to get claims for debugging
-            # jose requires a key even when not verifying, so we use the key we already have
-            unverified_claims = jwt.decode(
+            # This verifies the signature as well as checks expiration etc.
+            claims = jwt.decode(
                 id_token,
-                key,  # Key is still needed for decode, but we disable verification
+                key,
                 algorithms=["RS256"],
-                options={
-                    "verify_signature": False,
-                    "verify_exp": False,
-                    "verify_aud": False,
-                    "verify_iss": False
-                }
+                audience=token_aud,
+                issuer=expected_issuer,
             )
-            token_aud = unverified_claims.get('aud')
-            logger.error(f"Token audience: {token_aud}")
-            logger.error(f"Expected audiences: {cls._cognito_client_ids}")
-        except Exception as decode_error:
-            logger.error(f"Token audience: unknown (could not decode: {decode_error})")
-        
-        if last_error:
-            raise ValueError(f"Token audience mismatch. Token audience does not match any of: {cls._cognito_client_ids}") from last_error
-        else:
-            raise ValueError(f"Token verification failed for all client IDs: {cls._cognito_client_ids}")
+        except jwt.ExpiredSignatureError as e:
+            logger.error("Token expired: %s", e)
+            raise ValueError("Token has expired.") from e
+        except jwt.InvalidIssuerError as e:
+            logger.error("Invalid issuer: %s", e)
+            logger.error("Expected issuer: %s", expected_issuer)
+            raise ValueError(f"Token issuer mismatch. Expected: {expected_issuer}") from e
+        except Exception as e:
+            logger.debug("Token verification error with client_id %s: %s: %s", token_aud, type(e).__name__, e)
+            raise ValueError(f"Token verification failed for client ID {token_aud}: {str(e)}") from e
+
+        logger.info("Token verified successfully with client_id: %s", token_aud)
+        logger.info("Token claims: token_use=%s, sub=%s, aud=%s", claims.get('token_use'), claims.get('sub'), claims.get('aud'))
+        return claims
+
+    @classmethod
+    def _cache_claims(cls, token_hash: bytes, claims: dict[str, Any]) -> None:
+        expires_at = float(claims.get("exp", 0)) - cls._claims_cache_skew
+        now = time.time()
+        # Tokens without exp or within the skew of expiring would never be served from the cache
+        if expires_at <= now:
+            return
+        with cls._claims_cache_lock:
+            if len(cls._claims_cache) >= cls._claims_cache_maxsize:
+                for expired in [h for h, (expires_at, _) in cls._claims_cache.items() if expires_at <= now]:
+                    del cls._claims_cache[expired]
+                if len(cls._claims_cache) >= cls._claims_cache_maxsize:
+                    # Still full of live tokens: drop the oldest entry
+                    del cls._claims_cache[next(iter(cls._claims_cache))]
+            cls._claims_cache[token_hash] = (expires_at, claims)
 
     @classmethod
     async def get_user(
@@ -193,17 +310,18 @@ class IdTokenWithJose:
             logger.warning("get_user: No token provided")
             return None
             
-        try:
-            claims = cls.verify_id_token(cognito_id_token)
-        except Exception as e:
-            logger.error(f"get_user: Error verifying id token: {type(e).__name__}: {e}", exc_info=True)
-            return None
-
-        token_use = claims.get("token_use")
-        logger.info(f"Token use: {token_use}")
-        if token_use != "id":
-            logger.error(f"get_user: token_use is '{token_use}', expected 'id'")
-            return None
+        # A user replays the same token until it expires, so only verify it the first time
+        token_hash = hashlib.blake2b(cognito_id_token.encode(), digest_size=16).digest()
+        cached = cls._claims_cache.get(token_hash)
+        if cached is not None and cached[0] > time.time():
+            claims = cached[1]
+        else:
+            try:
+                claims = cls.verify_id_token(cognito_id_token)
+            except Exception as e:
+                logger.error("get_user: Error verifying id token: %s: %s", type(e).__name__, e, exc_info=True)
+                return None
+            cls._cache_claims(token_hash, claims)
 
         user = User(
             id=claims.get("sub", ""),
@@ -215,5 +333,5 @@ class IdTokenWithJose:
             phone_number=claims.get("phone_number", ""),
             enabled=claims.get("email_verified", False),
         )
-        logger.info(f"get_user: Created user object for {user.name}")
+        logger.info("get_user: Created user object for %s", user.name)
         return user
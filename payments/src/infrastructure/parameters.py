@@ -1,15 +1,25 @@
 import asyncio
-import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 from boto3 import Session  # pyright: ignore[reportMissingTypeStubs]
-from botocore.exceptions import ClientError  # pyright: ignore[reportMissingTypeStubs]
 
 
 class ParametersWithSSM:
     _aws_region: str = "us-east-1"
     _deployment_id: str = ""
+    _user_pool_id_name: str = ""
 
     _ssm_client: Any | None = None
+    _ssm_client_lock = asyncio.Lock()
+    # boto3 calls get their own threads, isolated from the loop's default executor; four workers
+    # also keep a burst of lookups well under the SSM throughput limit. Threads start on first use.
+    _ssm_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ssm")
+
+    # Parameter values by name, with the monotonic time they were fetched
+    _parameter_cache_ttl = 300.0
+    _parameter_cache_maxsize = 64
+    _parameter_cache: dict[str, tuple[float, str]] = {}
 
     @classmethod
     def set_environment(
@@ -29,119 +39,141 @@ class ParametersWithSSM:
             )
             raise Exception("deployment_id is None")
         cls._deployment_id = deployment_id
+        cls._user_pool_id_name = f"/{deployment_id}/auth/user_pool_ref"
+
+    @classmethod
+    def warmup(cls) -> None:
+        """
+        Builds the boto3 session and SSM client synchronously. Meant for the Lambda INIT phase,
+        where blocking is free and the client is then reused for the container's lifetime.
+        """
+        if cls._ssm_client is None:
+            session = Session()
+            cls._ssm_client = session.client("ssm", region_name=cls._aws_region)  # type: ignore
 
     @classmethod
     async def initialize(cls) -> None:
-        await cls._get_client()
+        cls.warmup()
 
     @classmethod
     async def _get_client(cls) -> Any:
         if cls._ssm_client is None:
-            session_kw = {}
-            session = Session(**session_kw)  # type: ignore
-            loop = asyncio.get_running_loop()
-            cls._ssm_client = await loop.run_in_executor(
-                None,
-                functools.partial(
-                    session.client,  # type: ignore
-                    "ssm",
-                    region_name=cls._aws_region,
-                ),
-            )
+            # Outside of INIT: build the client off the event loop, once even for concurrent callers
+            async with cls._ssm_client_lock:
+                if cls._ssm_client is None:
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(cls._ssm_executor, cls.warmup)
         return cls._ssm_client
 
     @classmethod
-    async def get_ecs_alb_url(cls, pipeline_id: str) -> str | None:
+    async def get_many(cls, names: list[str]) -> dict[str, str]:
+        """
+        Returns the values of the given parameters by name, served from the in-process cache where
+        possible. The rest is fetched with one GetParameters call per 10 names (the SSM limit).
+        Parameters that don't exist are left out of the result.
+        """
+        now = time.monotonic()
+        values: dict[str, str] = {}
+        missing: list[str] = []
+        for name in dict.fromkeys(names):
+            cached = cls._parameter_cache.get(name)
+            if cached is not None and now - cached[0] < cls._parameter_cache_ttl:
+                values[name] = cached[1]
+            else:
+                missing.append(name)
+        if not missing:
+            return values
+
         client = await cls._get_client()
-        try:
-            loop = asyncio.get_running_loop()
-            response = await loop.run_in_executor(
-                None,
-                functools.partial(
-                    client.get_parameter,
-                    Name=f"/{cls._deployment_id}/ecs/{pipeline_id}/albDnsName",
-                ),
+        loop = asyncio.get_running_loop()
+        responses = await asyncio.gather(
+            *(
+                loop.run_in_executor(cls._ssm_executor, cls._fetch_parameters, client, missing[i : i + 10])
+                for i in range(0, len(missing), 10)
             )
-        except ClientError as ex:
-            if ex.response["Error"]["Code"] == "ParameterNotFound":  # type: ignore
-                print(
-                    f"ParametersWithSSM::get_ecs_alb_url: WARNING, value not found deployment_id {cls._deployment_id}"
-                )
-                return None
-            else:
-                raise ex
-        else:
-            assert isinstance(response["Parameter"]["Value"], str)
-            return response["Parameter"]["Value"]
+        )
+        fetched_at = time.monotonic()
+        for response in responses:
+            for parameter in response["Parameters"]:
+                assert isinstance(parameter["Value"], str)
+                values[parameter["Name"]] = parameter["Value"]
+                cls._cache_parameter(parameter["Name"], parameter["Value"], fetched_at)
+        return values
+
+    @staticmethod
+    def _fetch_parameters(client: Any, names: list[str]) -> Any:
+        # run_in_executor takes positional arguments only, this saves a functools.partial per call
+        return client.get_parameters(Names=names)
+
+    @classmethod
+    def _cache_parameter(cls, name: str, value: str, fetched_at: float) -> None:
+        if name not in cls._parameter_cache and len(cls._parameter_cache) >= cls._parameter_cache_maxsize:
+            expired = [
+                key
+                for key, (cached_at, _) in cls._parameter_cache.items()
+                if fetched_at - cached_at >= cls._parameter_cache_ttl
+            ]
+            for key in expired:
+                del cls._parameter_cache[key]
+            if len(cls._parameter_cache) >= cls._parameter_cache_maxsize:
+                del cls._parameter_cache[next(iter(cls._parameter_cache))]
+        cls._parameter_cache[name] = (fetched_at, value)
+
+    @classmethod
+    async def get_ecs_alb_url(cls, pipeline_id: str) -> str | None:
+        name = f"/{cls._deployment_id}/ecs/{pipeline_id}/albDnsName"
+        value = (await cls.get_many([name])).get(name)
+        if value is None:
+            print(
+                f"ParametersWithSSM::get_ecs_alb_url: WARNING, value not found deployment_id {cls._deployment_id}"
+            )
+        return value
 
     @classmethod
     async def get_congito_user_pool_id(cls) -> str | None:
-        client = await cls._get_client()
-        try:
-            loop = asyncio.get_running_loop()
-            response = await loop.run_in_executor(
-                None,
-                functools.partial(
-                    client.get_parameter,
-                    Name=f"/{cls._deployment_id}/auth/user_pool_ref",
-                ),
+        name = cls._user_pool_id_name
+        value = (await cls.get_many([name])).get(name)
+        if value is None:
+            print(
+                f"ParametersWithSSM::get_congito_user_pool_id: WARNING, value not found deployment_id {cls._deployment_id}"
             )
-        except ClientError as ex:
-            if ex.response["Error"]["Code"] == "ParameterNotFound":  # type: ignore
-                print(
-                    f"ParametersWithSSM::get_congito_user_pool_id: WARNING, value not found deployment_id {cls._deployment_id}"
-                )
-                return None
-            else:
-                raise ex
-        else:
-            assert isinstance(response["Parameter"]["Value"], str)
-            return response["Parameter"]["Value"]
+        return value
 
     @classmethod
     async def get_cognito_client_id(cls, pipeline_id: str) -> str | None:
-        client = await cls._get_client()
-        try:
-            loop = asyncio.get_running_loop()
-            response = await loop.run_in_executor(
-                None,
-                functools.partial(
-                    client.get_parameter,
-                    Name=f"/{cls._deployment_id}/cdn/{pipeline_id}/auth_user_pool_client_id",
-                ),
+        name = f"/{cls._deployment_id}/cdn/{pipeline_id}/auth_user_pool_client_id"
+        value = (await cls.get_many([name])).get(name)
+        if value is None:
+            print(
+                f"ParametersWithSSM::get_cognito_client_id: WARNING, value not found deployment_id {cls._deployment_id}"
             )
-        except ClientError as ex:
-            if ex.response["Error"]["Code"] == "ParameterNotFound":  # type: ignore
+        return value
+
+    @classmethod
+    async def get_cognito_client_ids(cls, pipeline_ids: list[str]) -> dict[str, str | None]:
+        """
+        Batched get_cognito_client_id, see get_many. Missing parameters map to None.
+        """
+        names = {
+            pipeline_id: f"/{cls._deployment_id}/cdn/{pipeline_id}/auth_user_pool_client_id"
+            for pipeline_id in pipeline_ids
+        }
+        values = await cls.get_many(list(names.values()))
+        client_ids: dict[str, str | None] = {}
+        for pipeline_id, name in names.items():
+            client_ids[pipeline_id] = values.get(name)
+            if client_ids[pipeline_id] is None:
                 print(
-                    f"ParametersWithSSM::get_cognito_client_id: WARNING, value not found deployment_id {cls._deployment_id}"
+                    f"ParametersWithSSM::get_cognito_client_ids: WARNING, value not found deployment_id {cls._deployment_id}, pipeline_id {pipeline_id}"
                 )
-                return None
-            else:
-                raise ex
-        else:
-            assert isinstance(response["Parameter"]["Value"], str)
-            return response["Parameter"]["Value"]
+        return client_ids
 
     @classmethod
     async def get_lambda_arn(cls, pipeline_id: str) -> str | None:
-        client = await cls._get_client()
-        try:
-            loop = asyncio.get_running_loop()
-            response = await loop.run_in_executor(
-                None,
-                functools.partial(
-                    client.get_parameter,
-                    Name=f"/{cls._deployment_id}/lambda/{pipeline_id}/arn",
-                ),
+        name = f"/{cls._deployment_id}/lambda/{pipeline_id}/arn"
+        value = (await cls.get_many([name])).get(name)
+        if value is None:
+            print(
+                f"ParametersWithSSM::get_lambda_arn: WARNING, value not found deployment_id {cls._deployment_id}, pipeline_id {pipeline_id}"
             )
-        except ClientError as ex:
-            if ex.response["Error"]["Code"] == "ParameterNotFound":  # type: ignore
-                print(
-                    f"ParametersWithSSM::get_lambda_arn: WARNING, value not found deployment_id {cls._deployment_id}, pipeline_id {pipeline_id}"
-                )
-                return None
-            else:
-                raise ex
-        else:
-            assert isinstance(response["Parameter"]["Value"], str)
-            return response["Parameter"]["Value"]
+        return value
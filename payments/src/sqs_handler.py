@@ -1,10 +1,109 @@
-import json
+import asyncio
+import sys
+import orjson
 import base64
-from typing import Dict, Any
-from fastapi.testclient import TestClient
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
+from starlette.types import Message, Scope
 from api import app
 
-def handle_sqs_event(event: Dict[str, Any], context) -> Dict[str, Any]:
+# Sources set by the API Gateway to SQS integrations
+_API_GW_SOURCES = frozenset({'ApiGatewayV1SQSLambda', 'HttpApiV2SQSLambda'})
+
+# Characters a JSON document can start with, anything else is plain text
+_JSON_START_CHARS = frozenset('{["-0123456789tfn')
+
+_WEBHOOK_PATH = '/webhook'
+_WEBHOOK_RAW_PATH = _WEBHOOK_PATH.encode('latin-1')
+
+# Log lines of the SQS event being handled, written out in one go when it's done.
+# Record tasks started by gather copy the context, so they all append to the same list.
+_log_lines: ContextVar[Optional[List[str]]] = ContextVar('sqs_log_lines', default=None)
+
+def log(message: str) -> None:
+    """
+    Print a log line, or buffer it while an SQS event is being handled
+    
+    Args:
+        message: The line to log
+    """
+    lines = _log_lines.get()
+    if lines is None:
+        print(message)
+    else:
+        lines.append(message)
+
+def flush_log(lines: List[str]) -> None:
+    """
+    Write buffered log lines to stdout with a single write
+    
+    Args:
+        lines: Buffered log lines
+    """
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+async def post_webhook(request_body: bytes, content_type: str) -> Tuple[int, str, bytes]:
+    """
+    POST a request body to the FastAPI /webhook endpoint by calling the ASGI app directly,
+    without an HTTP client in between. Like the API Gateway path, no lifespan events are run.
+    
+    Args:
+        request_body: Raw request body
+        content_type: Content-Type header of the request
+        
+    Returns:
+        tuple: Response status code, response content type and raw response body
+    """
+    scope: Scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': _WEBHOOK_PATH,
+        'raw_path': _WEBHOOK_RAW_PATH,
+        'root_path': '',
+        'query_string': b'',
+        'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(request_body)).encode('latin-1')),
+        ],
+        'client': None,
+        'server': None,
+    }
+    request_sent = False
+    response_complete = asyncio.Event()
+    status_code = 500
+    response_content_type = ''
+    response_body = bytearray()
+    
+    async def receive() -> Message:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': request_body, 'more_body': False}
+        # Only report a disconnect once the response is done, so listeners don't cut it short
+        await response_complete.wait()
+        return {'type': 'http.disconnect'}
+    
+    async def send(message: Message) -> None:
+        nonlocal status_code, response_content_type
+        if message['type'] == 'http.response.start':
+            status_code = message['status']
+            for name, value in message.get('headers', []):
+                if name.lower() == b'content-type':
+                    response_content_type = value.decode('latin-1')
+        elif message['type'] == 'http.response.body':
+            response_body.extend(message.get('body', b''))
+            if not message.get('more_body', False):
+                response_complete.set()
+    
+    await app(scope, receive, send)
+    return status_code, response_content_type, bytes(response_body)
+
+async def handle_sqs_event(event: Dict[str, Any], context) -> Dict[str, Any]:
     """
     Handle SQS queue events
     
@@ -20,49 +119,90 @@ def handle_sqs_event(event: Dict[str, Any], context) -> Dict[str, Any]:
     Returns:
         dict: Response object
     """
-    print("Processing SQS event")
-    
-    processed_messages = []
-    
-    for record in event.get('Records', []):
-        if record.get('eventSource') == 'aws:sqs':
-            message_body = record.get('body', '')
-            message_id = record.get('messageId', 'unknown')
-            
-            print(f"Processing SQS message {message_id}: {message_body}")
-            
-            # Try to parse JSON message body
-            try:
-                parsed_body = json.loads(message_body)
-                
-                # Check if this is an API Gateway to SQS message
-                if is_api_gateway_sqs_message(parsed_body):
-                    print(f"Detected API Gateway to SQS message: {parsed_body.get('source', 'unknown')}")
-                    result = process_api_gateway_sqs_message(parsed_body, message_id)
-                    processed_messages.append(result)
-                else:
-                    # Regular SQS message
-                    processed_messages.append({
-                        'messageId': message_id,
-                        'body': parsed_body,
-                        'status': 'processed'
-                    })
-                    
-            except json.JSONDecodeError:
+    # One stdout write per event instead of several per record
+    lines: List[str] = []
+    token = _log_lines.set(lines)
+    try:
+        log("Processing SQS event")
+        
+        # Records are independent, so they're processed concurrently; results keep the record order
+        records = [
+            record for record in event.get('Records', [])
+            if record.get('eventSource') == 'aws:sqs'
+        ]
+        results = await asyncio.gather(
+            *(process_sqs_record(record) for record in records),
+            return_exceptions=True
+        )
+        
+        processed_messages = []
+        for record, result in zip(records, results):
+            if isinstance(result, BaseException):
+                message_id = record.get('messageId', 'unknown')
+                log(f"Error processing SQS message {message_id}: {str(result)}")
                 processed_messages.append({
                     'messageId': message_id,
-                    'body': message_body,
-                    'status': 'processed_as_text'
+                    'body': record.get('body', ''),
+                    'status': 'error',
+                    'error': str(result)
                 })
+            else:
+                processed_messages.append(result)
+        
+        return {
+            'statusCode': 200,
+            'body': orjson.dumps({
+                'message': 'SQS messages processed successfully',
+                'processed_count': len(processed_messages),
+                'messages': processed_messages,
+                'request_id': context.aws_request_id
+            }).decode()
+        }
+    finally:
+        _log_lines.reset(token)
+        flush_log(lines)
+
+async def process_sqs_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Process a single SQS record
+    
+    Args:
+        record: SQS record from the event
+        
+    Returns:
+        dict: Processing result
+    """
+    message_body = record.get('body', '')
+    message_id = record.get('messageId', 'unknown')
+    
+    log(f"Processing SQS message {message_id}: {message_body}")
+    
+    text_result = {
+        'messageId': message_id,
+        'body': message_body,
+        'status': 'processed_as_text'
+    }
+    
+    # Skip the parse (and the raised error) for bodies that can't be JSON to begin with
+    if message_body.lstrip()[:1] not in _JSON_START_CHARS:
+        return text_result
+    
+    # Try to parse JSON message body
+    try:
+        parsed_body = orjson.loads(message_body)
+    except orjson.JSONDecodeError:
+        return text_result
     
+    # Check if this is an API Gateway to SQS message
+    if is_api_gateway_sqs_message(parsed_body):
+        log(f"Detected API Gateway to SQS message: {parsed_body.get('source', 'unknown')}")
+        return await process_api_gateway_sqs_message(parsed_body, message_id)
+    
+    # Regular SQS message
     return {
-        'statusCode': 200,
-        'body': json.dumps({
-            'message': 'SQS messages processed successfully',
-            'processed_count': len(processed_messages),
-            'messages': processed_messages,
-            'request_id': context.aws_request_id
-        })
+        'messageId': message_id,
+        'body': parsed_body,
+        'status': 'processed'
     }
 
 def is_api_gateway_sqs_message(message_body: Dict[str, Any]) -> bool:
@@ -75,16 +215,18 @@ def is_api_gateway_sqs_message(message_body: Dict[str, Any]) -> bool:
     Returns:
         bool: True if it's an API Gateway to SQS message
     """
+    # Parsed JSON is never a dict subclass, so exact type checks are enough (and keep an
+    # unhashable 'source' out of the set lookup)
     return (
-        isinstance(message_body, dict) and 
-        'source' in message_body and 
-        message_body['source'] in ['ApiGatewayV1SQSLambda', 'HttpApiV2SQSLambda']
+        type(message_body) is dict and 
+        type(message_body.get('source')) is str and 
+        message_body['source'] in _API_GW_SOURCES
     )
 
-def process_api_gateway_sqs_message(message_body: Dict[str, Any], message_id: str) -> Dict[str, Any]:
+async def process_api_gateway_sqs_message(message_body: Dict[str, Any], message_id: str) -> Dict[str, Any]:
     """
     Process API Gateway to SQS message by reconstructing the HTTP request
-    and processing it through FastAPI TestClient
+    and processing it through the FastAPI app
     
     Args:
         message_body: Parsed SQS message body
@@ -97,9 +239,9 @@ def process_api_gateway_sqs_message(message_body: Dict[str, Any], message_id: st
     
     try:
         if source == 'ApiGatewayV1SQSLambda':
-            return process_api_gateway_v1_sqs_message(message_body, message_id)
+            return await process_api_gateway_v1_sqs_message(message_body, message_id)
         elif source == 'HttpApiV2SQSLambda':
-            return process_api_gateway_v2_sqs_message(message_body, message_id)
+            return await process_api_gateway_v2_sqs_message(message_body, message_id)
         else:
             return {
                 'messageId': message_id,
@@ -108,7 +250,7 @@ def process_api_gateway_sqs_message(message_body: Dict[str, Any], message_id: st
                 'source': source
             }
     except Exception as e:
-        print(f"Error processing API Gateway SQS message {message_id}: {str(e)}")
+        log(f"Error processing API Gateway SQS message {message_id}: {str(e)}")
         return {
             'messageId': message_id,
             'body': message_body,
@@ -116,7 +258,7 @@ def process_api_gateway_sqs_message(message_body: Dict[str, Any], message_id: st
             'error': str(e)
         }
 
-def process_api_gateway_v1_sqs_message(message_body: Dict[str, Any], message_id: str) -> Dict[str, Any]:
+async def process_api_gateway_v1_sqs_message(message_body: Dict[str, Any], message_id: str) -> Dict[str, Any]:
     """
     Process API Gateway v1 to SQS message
     
@@ -127,54 +269,51 @@ def process_api_gateway_v1_sqs_message(message_body: Dict[str, Any], message_id:
     Returns:
         dict: Processing result
     """
-    print(f"Processing API Gateway v1 SQS message: {message_id}")
+    log(f"Processing API Gateway v1 SQS message: {message_id}")
     
     # Extract the original request data
     json_payload = message_body.get('jsonPayload', {})
     base64_payload = message_body.get('base64payload')
     content_type = message_body.get('contentType', 'application/json')
     
-    # Determine the request body
+    # Determine the request body, kept as bytes since that's what the ASGI app receives
     if base64_payload:
-        # Decode base64 payload
+        # Decode base64 payload; bodies that aren't valid UTF-8 fall back to the base64 text
         try:
-            request_body = base64.b64decode(base64_payload).decode('utf-8')
+            request_body = base64.b64decode(base64_payload)
+            request_body.decode('utf-8')
         except Exception as e:
-            print(f"Error decoding base64 payload: {e}")
-            request_body = base64_payload
+            log(f"Error decoding base64 payload: {e}")
+            request_body = base64_payload.encode('utf-8')
     else:
         # Use JSON payload
-        request_body = json.dumps(json_payload) if json_payload else ""
+        request_body = orjson.dumps(json_payload) if json_payload else b""
     
-    # Create TestClient and make the request
-    with TestClient(app) as client:
-        try:
-            # Make POST request to webhook endpoint
-            response = client.post(
-                "/webhook",
-                content=request_body,
-                headers={"Content-Type": content_type}
-            )
-            
-            return {
-                'messageId': message_id,
-                'body': message_body,
-                'status': 'processed_via_fastapi',
-                'source': 'ApiGatewayV1SQSLambda',
-                'response_status': response.status_code,
-                'response_body': response.json() if response.headers.get('content-type', '').startswith('application/json') else response.text
-            }
-        except Exception as e:
-            print(f"Error making FastAPI request: {e}")
-            return {
-                'messageId': message_id,
-                'body': message_body,
-                'status': 'fastapi_error',
-                'source': 'ApiGatewayV1SQSLambda',
-                'error': str(e)
-            }
+    try:
+        # Make POST request to webhook endpoint
+        response_status, response_content_type, response_body = await post_webhook(
+            request_body, content_type
+        )
+        
+        return {
+            'messageId': message_id,
+            'body': message_body,
+            'status': 'processed_via_fastapi',
+            'source': 'ApiGatewayV1SQSLambda',
+            'response_status': response_status,
+            'response_body': orjson.loads(response_body) if response_content_type.startswith('application/json') else response_body.decode('utf-8')
+        }
+    except Exception as e:
+        log(f"Error making FastAPI request: {e}")
+        return {
+            'messageId': message_id,
+            'body': message_body,
+            'status': 'fastapi_error',
+            'source': 'ApiGatewayV1SQSLambda',
+            'error': str(e)
+        }
 
-def process_api_gateway_v2_sqs_message(message_body: Dict[str, Any], message_id: str) -> Dict[str, Any]:
+async def process_api_gateway_v2_sqs_message(message_body: Dict[str, Any], message_id: str) -> Dict[str, Any]:
     """
     Process API Gateway v2 to SQS message
     
@@ -185,35 +324,31 @@ def process_api_gateway_v2_sqs_message(message_body: Dict[str, Any], message_id:
     Returns:
         dict: Processing result
     """
-    print(f"Processing API Gateway v2 SQS message: {message_id}")
+    log(f"Processing API Gateway v2 SQS message: {message_id}")
     
     # Extract the original request data
     request_body = message_body.get('MessageBody', '')
     
-    # Create TestClient and make the request
-    with TestClient(app) as client:
-        try:
-            # Make POST request to webhook endpoint
-            response = client.post(
-                "/webhook",
-                content=request_body,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            return {
-                'messageId': message_id,
-                'body': message_body,
-                'status': 'processed_via_fastapi',
-                'source': 'HttpApiV2SQSLambda',
-                'response_status': response.status_code,
-                'response_body': response.json() if response.headers.get('content-type', '').startswith('application/json') else response.text
-            }
-        except Exception as e:
-            print(f"Error making FastAPI request: {e}")
-            return {
-                'messageId': message_id,
-                'body': message_body,
-                'status': 'fastapi_error',
-                'source': 'HttpApiV2SQSLambda',
-                'error': str(e)
-            }
+    try:
+        # Make POST request to webhook endpoint
+        response_status, response_content_type, response_body = await post_webhook(
+            request_body.encode('utf-8'), "application/json"
+        )
+        
+        return {
+            'messageId': message_id,
+            'body': message_body,
+            'status': 'processed_via_fastapi',
+            'source': 'HttpApiV2SQSLambda',
+            'response_status': response_status,
+            'response_body': orjson.loads(response_body) if response_content_type.startswith('application/json') else response_body.decode('utf-8')
+        }
+    except Exception as e:
+        log(f"Error making FastAPI request: {e}")
+        return {
+            'messageId': message_id,
+            'body': message_body,
+            'status': 'fastapi_error',
+            'source': 'HttpApiV2SQSLambda',
+            'error': str(e)
+        }